@@ -7,7 +7,8 @@ Dataset Playback and Visualization for dexmimicgen
 
 This script plays back robotic demonstration datasets stored in HDF5 format. It supports
 visualizing trajectories using either the simulation environment or stored image observations.
-Playback can be rendered on-screen or saved as a video.
+Playback can be rendered on-screen or saved as a video. All episodes are written to
+a single video, and the frame range of each episode is saved to a JSON file next to it.
 
 Args:
     --dataset (str): Path to the HDF5 dataset file.
@@ -18,11 +19,20 @@ Args:
     --render (bool): Render playback on-screen.
     --video_path (str, optional): Path to save the video file.
     --video_skip (int): Frame skip rate for video recording (default: 5).
+    --video_codec (str): ffmpeg video codec (default: libx264). Use h264_nvenc or hevc_nvenc
+        for GPU encoding, which requires ffmpeg built with NVENC support.
+    --video_crf (int, optional): Constant quality level for the video codec.
+    --video_preset (str, optional): Encoder preset (e.g. veryfast for libx264, p1 for NVENC).
+    --separator_frames (int): Number of title card frames between episodes in the video (default: 10).
     --render_image_names (list of str, optional): Camera names or image observation keys to render.
     --first (bool): Only use the first frame of each episode.
     --extend_states (bool): Extend the last step of episodes for 50 extra frames.
     --verbose (bool): Enable additional logging.
     --use_current_model (bool): Use the current model instead of the one stored in the dataset.
+    --parallel_render (bool): Render cameras concurrently when writing video (needs MUJOCO_GL=egl or osmesa).
+    --num_workers (int): Number of processes used to play back episodes when writing video from
+        states or observations (default: 1). Each process writes a contiguous range of the episodes,
+        and the parts are concatenated into the final video.
 
 Example usage:
     # render the dataset playback on-screen
@@ -36,24 +46,258 @@ Example usage:
 
     # debug the dataset playback with verbose logging and first frame only
     python script.py --dataset /path/to/dataset.hdf5 --verbose --first
+
+    # write the playback video of all episodes using 8 processes
+    python script.py --dataset /path/to/dataset.hdf5 --num_workers 8
+
+    # encode the playback video on the GPU
+    python script.py --dataset /path/to/dataset.hdf5 --video_codec h264_nvenc --video_preset p1
 """
 
 import argparse
+import copy
 import datetime
+import itertools
 import json
+import multiprocessing
 import os
+import queue
 import random
+import subprocess
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import h5py
 import imageio
+import mujoco
 import numpy as np
 import robosuite
+from PIL import Image, ImageDraw
 from termcolor import colored
 
 # IMPORTANT: you need to import the package to register the environments
 import dexmimicgen
 
+# number of video frames read at once from each image observation dataset
+OBS_READ_BLOCK_SIZE = 64
+
+# frame rate of playback videos
+VIDEO_FPS = 20
+
+# default HDF5 chunk cache size (per dataset) in bytes
+H5_CHUNK_CACHE_NBYTES = 1024 * 1024
+
+
+class AsyncVideoWriter:
+    """
+    Wraps an imageio writer so that frames are encoded on a background thread, letting
+    simulation and rendering continue while ffmpeg encodes. Frames are passed through a
+    bounded queue, so at most @max_queue_size frames are pending at any time. Frames
+    must not be modified after they are passed to @append_data. The number of frames
+    written so far is tracked in @num_frames.
+    """
+
+    def __init__(self, writer, max_queue_size=8):
+        """
+        Args:
+            writer (imageio writer): video writer used to encode frames
+            max_queue_size (int): maximum number of frames waiting to be encoded
+        """
+        self.writer = writer
+        self.max_queue_size = max_queue_size
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self.num_frames = 0
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            frame = self._queue.get()
+            if frame is None:
+                break
+            if self._error is not None:
+                # keep draining the queue so that append_data never blocks forever
+                continue
+            try:
+                self.writer.append_data(frame)
+            except Exception as e:
+                self._error = e
+
+    def append_data(self, frame):
+        if self._error is not None:
+            raise self._error
+        self._queue.put(frame)
+        self.num_frames += 1
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        self.writer.close()
+        if self._error is not None:
+            raise self._error
+
+
+def make_video_writer(video_path, codec="libx264", crf=None, preset=None):
+    """
+    Creates a video writer that encodes frames on a background thread.
+
+    Args:
+        video_path (str): path to the video file
+        codec (str): ffmpeg video codec, e.g. "libx264", or "h264_nvenc" / "hevc_nvenc"
+            for NVIDIA GPU encoding (requires ffmpeg built with NVENC support)
+        crf (int): constant quality level, passed as -crf for software codecs and as
+            -cq for NVENC codecs. If None, libx264 uses the imageio default quality and
+            other codecs use their own default rate control.
+        preset (str): encoder preset, e.g. "veryfast" for libx264 or "p1" for NVENC
+
+    Returns:
+        video_writer (AsyncVideoWriter): video writer
+    """
+    output_params = []
+    if preset is not None:
+        output_params += ["-preset", preset]
+    # imageio only maps its default quality to -crf for libx264, other codecs would
+    # get -qscale:v, which NVENC misinterprets as a constant QP request
+    quality = 5 if codec == "libx264" else None
+    if crf is not None:
+        output_params += ["-cq" if "nvenc" in codec else "-crf", str(crf)]
+        quality = None
+    writer = imageio.get_writer(
+        video_path,
+        fps=VIDEO_FPS,
+        codec=codec,
+        quality=quality,
+        pixelformat="yuv420p",
+        output_params=output_params,
+    )
+    return AsyncVideoWriter(writer)
+
+
+def get_video_frame_shape(args, traj_grp):
+    """
+    Returns the shape of the video frames written for a trajectory, with the camera
+    images placed side by side.
+
+    Args:
+        args (argparse.Namespace): playback arguments
+        traj_grp (hdf5 file group): hdf5 group of the trajectory
+
+    Returns:
+        shape (tuple): frame shape (H, W, 3)
+    """
+    if not args.use_obs:
+        return (512, 512 * len(args.render_image_names), 3)
+    shapes = [
+        traj_grp["obs/{}".format(k + "_image")].shape for k in args.render_image_names
+    ]
+    return (shapes[0][1], sum(shape[2] for shape in shapes), shapes[0][3])
+
+
+def make_title_card(shape, text):
+    """
+    Creates a black video frame with @text written in the top-left corner.
+
+    Args:
+        shape (tuple): frame shape (H, W, 3)
+        text (str): text to write
+
+    Returns:
+        frame (np.array): title card frame
+    """
+    image = Image.new("RGB", (shape[1], shape[0]))
+    ImageDraw.Draw(image).text((10, 10), text, fill=(255, 255, 255))
+    return np.asarray(image)
+
+
+def make_frame_buffers(shape, video_writer):
+    """
+    Preallocates video frame buffers that are reused in turn for frames passed to
+    @video_writer. An @AsyncVideoWriter holds on to up to max_queue_size pending frames
+    plus the one being encoded, so enough buffers are allocated that a buffer is never
+    overwritten before it has been encoded.
+
+    Args:
+        shape (tuple): frame shape (H, W, 3)
+        video_writer (imageio writer or AsyncVideoWriter): writer the frames are passed to
+
+    Returns:
+        frame_buffers (iterator): endless iterator over the preallocated buffers
+    """
+    num_buffers = getattr(video_writer, "max_queue_size", 0) + 2
+    return itertools.cycle(
+        [np.empty(shape, dtype=np.uint8) for _ in range(num_buffers)]
+    )
+
+
+class ParallelCameraRenderer:
+    """
+    Renders several cameras concurrently. Each camera gets its own offscreen MuJoCo
+    rendering context, which is created and used on a dedicated thread since a GL
+    context can only be current on one thread at a time. MuJoCo releases the GIL while
+    rendering, so the cameras render in parallel. This needs a GL backend that supports
+    one context per thread (e.g. MUJOCO_GL=egl or MUJOCO_GL=osmesa).
+    """
+
+    def __init__(self, sim, camera_names, height=512, width=512):
+        """
+        Args:
+            sim (MjSim): simulation to render. The renderer must be re-created if the
+                model is reloaded.
+            camera_names (list): cameras to render
+            height (int): image height
+            width (int): image width
+        """
+        self.camera_names = camera_names
+        self._model = sim.model._model
+        self._data = sim.data._data
+
+        # make sure the offscreen framebuffer fits the requested image size
+        self._model.vis.global_.offheight = max(
+            self._model.vis.global_.offheight, height
+        )
+        self._model.vis.global_.offwidth = max(self._model.vis.global_.offwidth, width)
+
+        # use the same visualization options (e.g. hidden collision geoms) as the
+        # sim's own offscreen context, so that frames match sequential rendering
+        render_context = sim._render_context_offscreen
+        if render_context is not None:
+            self._scene_option = copy.copy(render_context.vopt)
+        else:
+            self._scene_option = mujoco.MjvOption()
+            self._scene_option.geomgroup[0] = 0
+
+        self._executors = [ThreadPoolExecutor(max_workers=1) for _ in camera_names]
+        self._renderers = [
+            executor.submit(mujoco.Renderer, self._model, height, width).result()
+            for executor in self._executors
+        ]
+
+    def _render_camera(self, renderer, camera_name):
+        renderer.update_scene(
+            self._data, camera=camera_name, scene_option=self._scene_option
+        )
+        return renderer.render()
+
+    def render(self):
+        """
+        Returns:
+            images (list): one (H, W, 3) image per camera, in @camera_names order
+        """
+        futures = [
+            executor.submit(self._render_camera, renderer, cam_name)
+            for executor, renderer, cam_name in zip(
+                self._executors, self._renderers, self.camera_names
+            )
+        ]
+        return [future.result() for future in futures]
+
+    def close(self):
+        for executor, renderer in zip(self._executors, self._renderers):
+            executor.submit(renderer.close).result()
+            executor.shutdown()
+
 
 def playback_trajectory_with_env(
     env,
@@ -66,6 +310,7 @@ def playback_trajectory_with_env(
     camera_names=None,
     first=False,
     verbose=False,
+    parallel_render=False,
 ):
     """
     Helper function to playback a single trajectory using the simulator environment.
@@ -83,6 +328,9 @@ def playback_trajectory_with_env(
         camera_names (list): determines which camera(s) are used for rendering. Pass more than
             one to output a video with multiple camera views concatenated horizontally.
         first (bool): if True, only use the first frame of each episode.
+        verbose (bool): if True, log additional information
+        parallel_render (bool): if True, render the cameras concurrently with one
+            rendering context per camera (see @ParallelCameraRenderer)
     """
     write_video = video_writer is not None
     video_count = 0
@@ -95,43 +343,53 @@ def playback_trajectory_with_env(
     # env.reset()
 
     if verbose:
-        ep_meta = json.loads(initial_state["ep_meta"])
+        ep_meta = _get_ep_meta(initial_state)
         lang = ep_meta.get("lang", None)
         if lang is not None:
             print(colored(f"Instruction: {lang}", "green"))
         print(colored("Spawning environment...", "yellow"))
     reset_to(env, initial_state)
 
+    camera_renderer = None
+    if write_video and parallel_render and len(camera_names) > 1:
+        camera_renderer = ParallelCameraRenderer(
+            env.sim, camera_names, height=512, width=512
+        )
+
+    frame_buffers = None
+    if write_video:
+        frame_buffers = make_frame_buffers(
+            (512, 512 * len(camera_names), 3), video_writer
+        )
+
     traj_len = states.shape[0]
     action_playback = actions is not None
     if action_playback:
         assert states.shape[0] == actions.shape[0]
+        # states reached by playing back the actions, compared against @states afterwards
+        playback_states = np.empty_like(states[1:])
+
+    # when states are only loaded to write video frames, skip the ones that are not written
+    state_stride = 1
+    if write_video and not action_playback and not verbose:
+        state_stride = video_skip
 
     if render is False:
         print(colored("Running episode...", "yellow"))
 
     success = False
-    for i in range(traj_len):
-        start = time.time()
-
+    num_steps = 0
+    # on-screen rendering is paced to at most 60 frames per second
+    max_fr = 60
+    next_deadline = time.perf_counter()
+    for i in range(0, traj_len, state_stride):
         if action_playback:
             env.step(actions[i])
             if env._check_success():
                 success = True
-            if i < traj_len - 1:
-                # check whether the actions deterministically lead to the same recorded states
-                state_playback = np.array(env.sim.get_state().flatten())
-                if not np.all(np.equal(states[i + 1], state_playback)):
-                    err = np.linalg.norm(states[i + 1] - state_playback)
-                    if verbose or i == traj_len - 2:
-                        print(
-                            colored(
-                                "warning: playback diverged by {} at step {}".format(
-                                    err, i
-                                ),
-                                "yellow",
-                            )
-                        )
+            if i < traj_len - 1 and (verbose or i == traj_len - 2):
+                # divergence is reported at every step if verbose, else only at the last one
+                playback_states[i] = env.sim.get_state().flatten()
         else:
             reset_to(env, {"states": states[i]})
 
@@ -143,28 +401,36 @@ def playback_trajectory_with_env(
             # so that mujoco viewer renders
             env.viewer.update()
 
-            max_fr = 60
-            elapsed = time.time() - start
-            diff = 1 / max_fr - elapsed
-            if diff > 0:
-                time.sleep(diff)
+            # sleep until an absolute deadline so that oversleeping does not accumulate
+            next_deadline += 1 / max_fr
+            now = time.perf_counter()
+            if next_deadline > now:
+                time.sleep(next_deadline - now)
+            else:
+                # fell behind (e.g. a slow step), restart pacing from now
+                next_deadline = now
 
         # video render
         if write_video:
             if video_count % video_skip == 0:
-                video_img = []
-                for cam_name in camera_names:
-                    im = env.sim.render(height=512, width=512, camera_name=cam_name)[
-                        ::-1
-                    ]
-                    video_img.append(im)
-                video_img = np.concatenate(
-                    video_img, axis=1
-                )  # concatenate horizontally
+                if camera_renderer is not None:
+                    images = camera_renderer.render()
+                else:
+                    images = (
+                        env.sim.render(height=512, width=512, camera_name=cam_name)[
+                            ::-1
+                        ]
+                        for cam_name in camera_names
+                    )
+                # concatenate horizontally
+                video_img = next(frame_buffers)
+                for j, im in enumerate(images):
+                    video_img[:, j * 512 : (j + 1) * 512] = im
                 video_writer.append_data(video_img)
 
-            video_count += 1
+            video_count += state_stride
 
+        num_steps += 1
         if first:
             break
 
@@ -172,6 +438,30 @@ def playback_trajectory_with_env(
         env.viewer.close()
         env.viewer = None
 
+    if camera_renderer is not None:
+        camera_renderer.close()
+
+    if action_playback:
+        # check whether the actions deterministically lead to the same recorded states
+        num_checked = min(num_steps, traj_len - 1)
+        if verbose:
+            checked_steps = np.arange(num_checked)
+        else:
+            # only the last step, if it was reached
+            checked_steps = np.arange(max(traj_len - 2, 0), num_checked)
+        errs = np.linalg.norm(
+            states[checked_steps + 1] - playback_states[checked_steps], axis=1
+        )
+        for i in np.nonzero(errs > 0)[0]:
+            print(
+                colored(
+                    "warning: playback diverged by {} at step {}".format(
+                        errs[i], checked_steps[i]
+                    ),
+                    "yellow",
+                )
+            )
+
     if action_playback and not success:
         print(colored("warning: playback did not success", "red"))
 
@@ -198,19 +488,35 @@ def playback_trajectory_with_obs(
     assert (
         image_names is not None
     ), "error: must specify at least one image observation to use in @image_names"
-    video_count = 0
-
-    traj_len = traj_grp["obs/{}".format(image_names[0] + "_image")].shape[0]
-    for i in range(traj_len):
-        if video_count % video_skip == 0:
-            # concatenate image obs together
-            im = [traj_grp["obs/{}".format(k + "_image")][i] for k in image_names]
-            frame = np.concatenate(im, axis=1)
+    dsets = [traj_grp["obs/{}".format(k + "_image")] for k in image_names]
+    traj_len = dsets[0].shape[0]
+    if first:
+        traj_len = min(traj_len, 1)
+
+    # camera images are placed side by side in the video frame
+    offsets = np.cumsum([0] + [dset.shape[2] for dset in dsets])
+    height, channels = dsets[0].shape[1], dsets[0].shape[3]
+
+    # read frames in strided blocks (one h5py call per camera per block) instead of
+    # one call per frame per camera, capping the block size to bound memory usage.
+    # Each camera is read directly into its columns of the block of video frames, so
+    # frames are assembled without any per-frame copies.
+    block_len = OBS_READ_BLOCK_SIZE * video_skip
+    for start in range(0, traj_len, block_len):
+        end = min(start + block_len, traj_len)
+        # a new array per block, since the video writer may still hold earlier frames
+        frames = np.empty(
+            (len(range(start, end, video_skip)), height, offsets[-1], channels),
+            dtype=dsets[0].dtype,
+        )
+        for dset, lo, hi in zip(dsets, offsets[:-1], offsets[1:]):
+            dset.read_direct(
+                frames,
+                source_sel=np.s_[start:end:video_skip],
+                dest_sel=np.s_[:, :, lo:hi],
+            )
+        for frame in frames:
             video_writer.append_data(frame)
-        video_count += 1
-
-        if first:
-            break
 
 
 def get_env_metadata_from_dataset(dataset_path, ds_format="robomimic"):
@@ -237,6 +543,122 @@ def get_env_metadata_from_dataset(dataset_path, ds_format="robomimic"):
     return env_meta
 
 
+def read_dataset_into_buffer(dset, buffers, key, extra_rows=0):
+    """
+    Reads @dset directly into a preallocated buffer that is reused across calls with
+    the same @key, and only reallocated when it is too small. The returned array is a
+    view into the buffer, so it is only valid until the next call with the same @key.
+
+    Args:
+        dset (h5py.Dataset): dataset to read
+        buffers (dict): reusable buffers, keyed by @key
+        key (str): name of the buffer to read into
+        extra_rows (int): number of rows to append after the data, filled with copies
+            of the last row
+
+    Returns:
+        data (np.array): dataset contents followed by @extra_rows copies of the last row
+    """
+    num_rows = dset.shape[0]
+    total_rows = num_rows + extra_rows
+    buf = buffers.get(key, None)
+    if (
+        buf is None
+        or buf.shape[0] < total_rows
+        or buf.shape[1:] != dset.shape[1:]
+        or buf.dtype != dset.dtype
+    ):
+        buf = np.empty((total_rows,) + dset.shape[1:], dtype=dset.dtype)
+        buffers[key] = buf
+    data = buf[:total_rows]
+    dset.read_direct(data, dest_sel=np.s_[:num_rows])
+    data[num_rows:] = data[num_rows - 1]
+    return data
+
+
+def load_dataset(dset, buffers, key, extra_rows=0):
+    """
+    Loads a trajectory dataset such as states or actions. Contiguous, uncompressed
+    datasets are memory-mapped directly from the file, which avoids copying them
+    through the HDF5 library. Other datasets, or datasets that need @extra_rows, are
+    read with @read_dataset_into_buffer.
+
+    Args:
+        dset (h5py.Dataset): dataset to load
+        buffers (dict): reusable buffers, keyed by @key
+        key (str): name of the buffer to read into
+        extra_rows (int): number of rows to append after the data, filled with copies
+            of the last row
+
+    Returns:
+        data (np.array): dataset contents followed by @extra_rows copies of the last row.
+            Memory-mapped data is read-only.
+    """
+    if extra_rows == 0 and dset.chunks is None and dset.compression is None:
+        # offset is None if no storage has been allocated for the dataset
+        offset = dset.id.get_offset()
+        if offset is not None:
+            return np.memmap(
+                dset.file.filename,
+                dtype=dset.dtype,
+                mode="r",
+                offset=offset,
+                shape=dset.shape,
+            )
+    return read_dataset_into_buffer(dset, buffers, key, extra_rows=extra_rows)
+
+
+def _next_prime(n):
+    """
+    Returns the smallest prime number >= @n.
+    """
+    n = max(n, 2)
+    while any(n % d == 0 for d in range(2, int(n**0.5) + 1)):
+        n += 1
+    return n
+
+
+def get_chunk_cache_kwargs(dataset_path, image_names):
+    """
+    Sizes the HDF5 chunk cache for reading image observations. By default the
+    cache is 1 MB per dataset, so chunks larger than that (or a frame spread across
+    many chunks) are decompressed again for every read that touches them. The cache
+    is sized to hold all chunks covering one frame of the largest image observation,
+    as found in the first trajectory of the dataset.
+
+    Args:
+        dataset_path (str): path to dataset
+        image_names (list): image observations that will be read
+
+    Returns:
+        cache_kwargs (dict): chunk cache keyword arguments to pass to h5py.File
+    """
+    dataset_path = os.path.expanduser(dataset_path)
+    f = h5py.File(dataset_path, "r")
+    traj_grp = next(iter(f["data"].values()))
+    cache_nbytes = H5_CHUNK_CACHE_NBYTES
+    chunk_nbytes = None
+    for k in image_names:
+        dset = traj_grp["obs/{}".format(k + "_image")]
+        if dset.chunks is None:
+            continue
+        nbytes = int(np.prod(dset.chunks)) * dset.dtype.itemsize
+        chunks_per_frame = int(
+            np.prod([-(-s // c) for s, c in zip(dset.shape[1:], dset.chunks[1:])])
+        )
+        cache_nbytes = max(cache_nbytes, chunks_per_frame * nbytes)
+        chunk_nbytes = nbytes if chunk_nbytes is None else min(chunk_nbytes, nbytes)
+    f.close()
+
+    if chunk_nbytes is None:
+        # no chunked datasets, keep the HDF5 defaults
+        return dict()
+
+    # HDF5 recommends ~100x as many hash slots as chunks in the cache, and a prime count
+    num_slots = _next_prime(100 * max(1, cache_nbytes // chunk_nbytes))
+    return dict(rdcc_nbytes=cache_nbytes, rdcc_nslots=num_slots, rdcc_w0=0.75)
+
+
 class ObservationKeyToModalityDict(dict):
     """
     Custom dictionary class with the sole additional purpose of automatically registering new "keys" at runtime
@@ -246,17 +668,64 @@ class ObservationKeyToModalityDict(dict):
     modality.
     """
 
+    # keys that have already been warned about, shared across instances
+    _warned = set()
+
     def __getitem__(self, item):
-        # If a key doesn't already exist, warn the user and add default mapping
-        if item not in self.keys():
-            print(
-                f"ObservationKeyToModalityDict: {item} not found,"
-                f" adding {item} to mapping with assumed low_dim modality!"
-            )
+        # If a key doesn't already exist, warn the user (once per key) and add default mapping
+        if not dict.__contains__(self, item):
+            if item not in self._warned:
+                self._warned.add(item)
+                print(
+                    f"ObservationKeyToModalityDict: {item} not found,"
+                    f" adding {item} to mapping with assumed low_dim modality!"
+                )
             self.__setitem__(item, "low_dim")
         return super(ObservationKeyToModalityDict, self).__getitem__(item)
 
 
+def _get_ep_meta(state):
+    """
+    Returns the parsed episode metadata of a simulator @state dict. The parsed metadata
+    is cached in the dict, so the json string is decoded only once per episode.
+
+    Args:
+        state (dict): simulator state, with the episode metadata json string (or None)
+            under "ep_meta"
+
+    Returns:
+        ep_meta (dict): episode metadata, empty if there is none
+    """
+    if not isinstance(state.get("_ep_meta_parsed", None), dict):
+        ep_meta = state.get("ep_meta", None)
+        state["_ep_meta_parsed"] = json.loads(ep_meta) if ep_meta else {}
+    return state["_ep_meta_parsed"]
+
+
+def _prepare_env_reset(env):
+    """
+    Looks up the version-dependent functions used by @reset_to once and caches them
+    on @env, since they do not change for a given environment.
+
+    Args:
+        env (MujocoEnv): environment
+    """
+    if hasattr(env, "set_attrs_from_ep_meta"):  # older versions had this function
+        env._dmg_set_ep_meta = env.set_attrs_from_ep_meta
+    elif hasattr(env, "set_ep_meta"):  # newer versions
+        env._dmg_set_ep_meta = env.set_ep_meta
+    else:
+        env._dmg_set_ep_meta = None
+    # older versions of environment had update_sites function,
+    # later versions renamed this to update_state
+    env._dmg_update_fns = [
+        getattr(env, name)
+        for name in ("update_sites", "update_state")
+        if hasattr(env, name)
+    ]
+    env._dmg_robosuite_version_id = int(robosuite.__version__.split(".")[1])
+
+
 def reset_to(env, state):
     """
     Reset to a specific simulator state.
@@ -270,23 +739,19 @@ def reset_to(env, state):
         observation (dict): observation dictionary after setting the simulator state (only
             if "states" is in @state)
     """
+    if not hasattr(env, "_dmg_robosuite_version_id"):
+        _prepare_env_reset(env)
+
     should_ret = False
     if "model" in state:
-        if state.get("ep_meta", None) is not None:
-            # set relevant episode information
-            ep_meta = json.loads(state["ep_meta"])
-        else:
-            ep_meta = {}
-        if hasattr(env, "set_attrs_from_ep_meta"):  # older versions had this function
-            env.set_attrs_from_ep_meta(ep_meta)
-        elif hasattr(env, "set_ep_meta"):  # newer versions
-            env.set_ep_meta(ep_meta)
+        # set relevant episode information
+        if env._dmg_set_ep_meta is not None:
+            env._dmg_set_ep_meta(_get_ep_meta(state))
         # this reset is necessary.
         # while the call to env.reset_from_xml_string does call reset,
         # that is only a "soft" reset that doesn't actually reload the model.
         env.reset()
-        robosuite_version_id = int(robosuite.__version__.split(".")[1])
-        if robosuite_version_id <= 3:
+        if env._dmg_robosuite_version_id <= 3:
             from robosuite.utils.mjcf_utils import postprocess_model_xml
 
             xml = postprocess_model_xml(state["model"])
@@ -305,12 +770,8 @@ def reset_to(env, state):
         should_ret = True
 
     # update state as needed
-    if hasattr(env, "update_sites"):
-        # older versions of environment had update_sites function
-        env.update_sites()
-    if hasattr(env, "update_state"):
-        # later versions renamed this to update_state
-        env.update_state()
+    for update_fn in env._dmg_update_fns:
+        update_fn()
 
     # if should_ret:
     #     # only return obs if we've done a forward call - otherwise the observations will be garbage
@@ -318,6 +779,245 @@ def reset_to(env, state):
     return None
 
 
+def create_env(args, write_video):
+    """
+    Creates the environment used to play back the dataset.
+
+    Args:
+        args (argparse.Namespace): playback arguments
+        write_video (bool): whether frames will be rendered offscreen to video
+
+    Returns:
+        env (MujocoEnv): environment
+    """
+    env_meta = get_env_metadata_from_dataset(dataset_path=args.dataset)
+
+    env_kwargs = env_meta["env_kwargs"]
+    env_kwargs["env_name"] = env_meta["env_name"]
+    env_kwargs["has_renderer"] = False
+    env_kwargs["renderer"] = "mjviewer"
+    env_kwargs["has_offscreen_renderer"] = write_video
+    env_kwargs["use_camera_obs"] = False
+
+    if args.verbose:
+        print(
+            colored(
+                "Initializing environment for {}...".format(env_kwargs["env_name"]),
+                "yellow",
+            )
+        )
+    if "env_lang" in env_kwargs:
+        env_kwargs.pop("env_lang")
+    if "env_name" == "TwoArnCanSortRandom" and args.use_current_model:
+        print(
+            colored(
+                "Warning: TwoArnCanSortRandom environment with use_current_model will have chance of incorrect color placement (red to blue bin or blue to red bin)",
+                "yellow",
+            )
+        )
+    env = robosuite.make(**env_kwargs)
+    _prepare_env_reset(env)
+    return env
+
+
+def playback_demos(args, demos, video_path=None, leading_separator=False):
+    """
+    Plays back a list of episodes from the dataset.
+
+    Args:
+        args (argparse.Namespace): playback arguments
+        demos (list): names of the episodes to play back, in order
+        video_path (str): if provided, write the episodes to this video file
+        leading_separator (bool): if True, also write separator frames before the
+            first episode (used when the video continues another part)
+
+    Returns:
+        video_segments (list): frame range of each episode in the video, as dicts with
+            keys "demo", "start_frame" and "end_frame" (exclusive)
+    """
+    write_video = video_path is not None
+
+    # create environment only if not playing back with observations
+    env = None
+    if not args.use_obs:
+        env = create_env(args, write_video=write_video)
+
+    cache_kwargs = dict()
+    if args.use_obs:
+        cache_kwargs = get_chunk_cache_kwargs(
+            dataset_path=args.dataset, image_names=args.render_image_names
+        )
+    f = h5py.File(args.dataset, "r", **cache_kwargs)
+
+    # maybe dump video
+    video_writer = None
+    if write_video:
+        video_writer = make_video_writer(
+            video_path,
+            codec=args.video_codec,
+            crf=args.video_crf,
+            preset=args.video_preset,
+        )
+
+    data_grp = f["data"]
+    video_segments = []
+    # buffers reused across episodes when reading states and actions
+    read_buffers = dict()
+    for ind in range(len(demos)):
+        ep = demos[ind]
+        print(colored("\nPlaying back episode: {}".format(ep), "yellow"))
+        traj_grp = data_grp[ep]
+
+        if write_video:
+            # separate episodes in the video with a few frames showing the episode name
+            if ind > 0 or leading_separator:
+                title_card = make_title_card(get_video_frame_shape(args, traj_grp), ep)
+                for _ in range(args.separator_frames):
+                    video_writer.append_data(title_card)
+            start_frame = video_writer.num_frames
+
+        if args.use_obs:
+            playback_trajectory_with_obs(
+                traj_grp=traj_grp,
+                video_writer=video_writer,
+                video_skip=args.video_skip,
+                image_names=args.render_image_names,
+                first=args.first,
+            )
+        else:
+            # prepare initial state to reload from
+            traj_attrs = traj_grp.attrs
+            states = load_dataset(
+                traj_grp["states"],
+                read_buffers,
+                "states",
+                extra_rows=50 if args.extend_states else 0,
+            )
+            initial_state = dict(states=states[0])
+            initial_state["model"] = traj_attrs["model_file"]
+            if args.use_current_model:
+                initial_state["model"] = env.sim.model.get_xml()
+            initial_state["ep_meta"] = traj_attrs.get("ep_meta", None)
+
+            # supply actions if using open-loop action playback
+            actions = None
+            if args.use_actions:
+                actions = load_dataset(traj_grp["actions"], read_buffers, "actions")
+
+            playback_trajectory_with_env(
+                env=env,
+                initial_state=initial_state,
+                states=states,
+                actions=actions,
+                render=args.render,
+                video_writer=video_writer,
+                video_skip=args.video_skip,
+                camera_names=args.render_image_names,
+                first=args.first,
+                verbose=args.verbose,
+                parallel_render=args.parallel_render,
+            )
+
+        if write_video:
+            video_segments.append(
+                dict(
+                    demo=ep, start_frame=start_frame, end_frame=video_writer.num_frames
+                )
+            )
+
+    f.close()
+    if write_video:
+        video_writer.close()
+
+    if env is not None:
+        env.close()
+
+    return video_segments
+
+
+def playback_demos_parallel(args, demos, num_workers):
+    """
+    Plays back a list of episodes to video with several worker processes. Episodes are
+    split into contiguous ranges, one per worker, each worker writes its episodes to its
+    own part video, and the parts are then concatenated into @args.video_path without
+    re-encoding. The resulting video is laid out as with single-process playback.
+
+    Args:
+        args (argparse.Namespace): playback arguments
+        demos (list): names of the episodes to play back, in order
+        num_workers (int): number of worker processes
+
+    Returns:
+        video_segments (list): frame range of each episode in the concatenated video,
+            in the same format as @playback_demos
+    """
+    # only needed to concatenate the part videos, so imported here
+    import imageio_ffmpeg
+
+    video_root, video_ext = os.path.splitext(args.video_path)
+    part_paths = [
+        "{}.part{}{}".format(video_root, wid, video_ext) for wid in range(num_workers)
+    ]
+    list_path = video_root + ".parts.txt"
+    bounds = np.linspace(0, len(demos), num_workers + 1).astype(int)
+    worker_demos = [demos[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+    # limit each worker to one OpenMP thread so that the workers do not oversubscribe
+    # the CPU (the setting is inherited by the worker processes)
+    os.environ.setdefault("OMP_NUM_THREADS", "1")
+
+    try:
+        # spawn fresh processes instead of forking, since the parent may hold GL contexts
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(num_workers) as pool:
+            # every part but the first continues the video, so it starts with a separator
+            part_segments = pool.starmap(
+                playback_demos,
+                [
+                    (args, worker_demos[wid], part_paths[wid], wid > 0)
+                    for wid in range(num_workers)
+                ],
+            )
+
+        with open(list_path, "w") as list_file:
+            for part_path in part_paths:
+                list_file.write("file '{}'\n".format(os.path.abspath(part_path)))
+        subprocess.run(
+            [
+                imageio_ffmpeg.get_ffmpeg_exe(),
+                "-y",
+                "-loglevel",
+                "error",
+                "-f",
+                "concat",
+                "-safe",
+                "0",
+                "-i",
+                list_path,
+                "-c",
+                "copy",
+                args.video_path,
+            ],
+            check=True,
+        )
+    finally:
+        for path in part_paths + [list_path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    # shift frame ranges by the number of frames in the preceding parts
+    video_segments = []
+    frame_offset = 0
+    for segments in part_segments:
+        for segment in segments:
+            segment["start_frame"] += frame_offset
+            segment["end_frame"] += frame_offset
+            video_segments.append(segment)
+        frame_offset = video_segments[-1]["end_frame"]
+
+    return video_segments
+
+
 def playback_dataset(args):
     # some arg checking
     write_video = args.render is not True
@@ -343,37 +1043,10 @@ def playback_dataset(args):
             not args.use_actions
         ), "playback with observations is offline and does not support action playback"
 
-    env = None
-
-    # create environment only if not playing back with observations
-    if not args.use_obs:
-
-        env_meta = get_env_metadata_from_dataset(dataset_path=args.dataset)
-
-        env_kwargs = env_meta["env_kwargs"]
-        env_kwargs["env_name"] = env_meta["env_name"]
-        env_kwargs["has_renderer"] = False
-        env_kwargs["renderer"] = "mjviewer"
-        env_kwargs["has_offscreen_renderer"] = write_video
-        env_kwargs["use_camera_obs"] = False
-
-        if args.verbose:
-            print(
-                colored(
-                    "Initializing environment for {}...".format(env_kwargs["env_name"]),
-                    "yellow",
-                )
-            )
-        if "env_lang" in env_kwargs:
-            env_kwargs.pop("env_lang")
-        if "env_name" == "TwoArnCanSortRandom" and args.use_current_model:
-            print(
-                colored(
-                    "Warning: TwoArnCanSortRandom environment with use_current_model will have chance of incorrect color placement (red to blue bin or blue to red bin)",
-                    "yellow",
-                )
-            )
-        env = robosuite.make(**env_kwargs)
+    if args.num_workers > 1:
+        assert (
+            write_video and not args.use_actions
+        ), "parallel playback is only supported when writing video from states or observations"
 
     f = h5py.File(args.dataset, "r")
 
@@ -387,69 +1060,38 @@ def playback_dataset(args):
     elif "data" in f.keys():
         demos = list(f["data"].keys())
 
-    inds = np.argsort([int(elem[5:]) for elem in demos])
-    demos = [demos[i] for i in inds]
+    f.close()
+
+    demos = sorted(demos, key=lambda elem: int(elem[5:]))
 
     # maybe reduce the number of demonstrations to playback
     if args.n is not None:
-        random.shuffle(demos)
-        demos = demos[: args.n]
-
-    # maybe dump video
-    video_writer = None
-    if write_video:
-        video_writer = imageio.get_writer(args.video_path, fps=20)
-
-    for ind in range(len(demos)):
-        ep = demos[ind]
-        print(colored("\nPlaying back episode: {}".format(ep), "yellow"))
-
-        if args.use_obs:
-            playback_trajectory_with_obs(
-                traj_grp=f["data/{}".format(ep)],
-                video_writer=video_writer,
-                video_skip=args.video_skip,
-                image_names=args.render_image_names,
-                first=args.first,
-            )
-            continue
-
-        # prepare initial state to reload from
-        states = f["data/{}/states".format(ep)][()]
-        initial_state = dict(states=states[0])
-        initial_state["model"] = f["data/{}".format(ep)].attrs["model_file"]
-        if args.use_current_model:
-            initial_state["model"] = env.sim.model.get_xml()
-        initial_state["ep_meta"] = f["data/{}".format(ep)].attrs.get("ep_meta", None)
-
-        if args.extend_states:
-            states = np.concatenate((states, [states[-1]] * 50))
+        demos = random.sample(demos, min(args.n, len(demos)))
 
-        # supply actions if using open-loop action playback
-        actions = None
-        if args.use_actions:
-            actions = f["data/{}/actions".format(ep)][()]
-
-        playback_trajectory_with_env(
-            env=env,
-            initial_state=initial_state,
-            states=states,
-            actions=actions,
-            render=args.render,
-            video_writer=video_writer,
-            video_skip=args.video_skip,
-            camera_names=args.render_image_names,
-            first=args.first,
-            verbose=args.verbose,
+    num_workers = min(args.num_workers, len(demos))
+    if num_workers > 1:
+        video_segments = playback_demos_parallel(args, demos, num_workers)
+    else:
+        video_segments = playback_demos(
+            args, demos, video_path=args.video_path if write_video else None
         )
 
-    f.close()
     if write_video:
         print(colored(f"Saved video to {args.video_path}", "green"))
-        video_writer.close()
 
-    if env is not None:
-        env.close()
+        # record where each episode is in the video, so that it can be cut out later
+        segments_path = os.path.splitext(args.video_path)[0] + ".json"
+        with open(segments_path, "w") as segments_file:
+            json.dump(
+                dict(
+                    fps=VIDEO_FPS,
+                    separator_frames=args.separator_frames,
+                    episodes=video_segments,
+                ),
+                segments_file,
+                indent=4,
+            )
+        print(colored(f"Saved episode frame ranges to {segments_path}", "green"))
 
 
 if __name__ == "__main__":
@@ -511,6 +1153,36 @@ if __name__ == "__main__":
         help="render frames to video every n steps",
     )
 
+    # Video encoder settings
+    parser.add_argument(
+        "--video_codec",
+        type=str,
+        default="libx264",
+        help="ffmpeg video codec, e.g. h264_nvenc or hevc_nvenc for GPU encoding (needs ffmpeg with NVENC)",
+    )
+
+    parser.add_argument(
+        "--video_crf",
+        type=int,
+        default=None,
+        help="(optional) constant quality level for the video codec (-crf, or -cq for NVENC codecs)",
+    )
+
+    parser.add_argument(
+        "--video_preset",
+        type=str,
+        default=None,
+        help="(optional) encoder preset, e.g. veryfast for libx264 or p1 for NVENC codecs",
+    )
+
+    # Number of title card frames between episodes in the video
+    parser.add_argument(
+        "--separator_frames",
+        type=int,
+        default=10,
+        help="number of frames showing the episode name between episodes in the video",
+    )
+
     # camera names to render, or image observations to use for writing to video
     parser.add_argument(
         "--render_image_names",
@@ -548,5 +1220,20 @@ if __name__ == "__main__":
         help="use the current model instead of the one stored in the dataset",
     )
 
+    # Render multiple cameras concurrently, with one rendering context per camera
+    parser.add_argument(
+        "--parallel_render",
+        action="store_true",
+        help="render cameras concurrently when writing video (needs MUJOCO_GL=egl or osmesa)",
+    )
+
+    # Play back episodes in parallel worker processes when writing video
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=1,
+        help="number of processes used to play back episodes when writing video from states or observations",
+    )
+
     args = parser.parse_args()
     playback_dataset(args)
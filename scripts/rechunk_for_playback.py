@@ -0,0 +1,174 @@
+# Copyright (c) 2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+#
+# Licensed under the NVIDIA Source Code License [see LICENSE for details].
+
+"""
+Rechunk Image Observations for Playback
+
+This script writes a copy of an HDF5 dataset in which every image observation
+(data/demo_*/obs/*_image) is stored with frame-aligned chunks. Datasets chunked for
+training-time random access can span many frames per chunk, so reading them one
+frame at a time during playback decompresses the same chunk over and over. All other
+groups, datasets and attributes are copied unchanged.
+
+Chunks hold up to @frames_per_chunk frames (set it to the playback --video_skip to align
+chunks with the playback stride), with fewer frames per chunk if needed to keep chunks
+within ~1 MB. If a single frame is larger than ~1 MB, chunks hold one frame and are
+split along the image height so that each chunk stays around 1 MB.
+
+Args:
+    --dataset (str): Path to the source HDF5 dataset file.
+    --output (str, optional): Path to the rechunked copy (default: <dataset>_playback.hdf5).
+    --frames_per_chunk (int): Maximum number of frames per chunk (default: 1).
+    --compression (str): Compression filter for image datasets (default: "lzf").
+    --block_size (int): Number of frames copied at once (default: 64).
+
+Example usage:
+    # rechunk a dataset, then play back image observations from the copy
+    python rechunk_for_playback.py --dataset /path/to/dataset.hdf5
+    python playback_datasets.py --dataset /path/to/dataset_playback.hdf5 --use-obs
+
+    # align chunks with a playback stride of 5 frames
+    python rechunk_for_playback.py --dataset /path/to/dataset.hdf5 --frames_per_chunk 5
+"""
+
+import argparse
+
+import h5py
+from termcolor import colored
+
+# target size of a single chunk in bytes
+CHUNK_NBYTES = 1024 * 1024
+
+
+def is_image_obs(name, item):
+    """
+    Returns True if @item is an image observation dataset (N, H, W, C).
+    """
+    return isinstance(item, h5py.Dataset) and name.endswith("_image") and item.ndim == 4
+
+
+def get_playback_chunks(shape, itemsize, frames_per_chunk=1):
+    """
+    Computes frame-aligned chunk shape for an image observation dataset.
+
+    Args:
+        shape (tuple): dataset shape (N, H, W, C)
+        itemsize (int): size of a single element in bytes
+        frames_per_chunk (int): maximum number of frames per chunk
+
+    Returns:
+        chunks (tuple): chunk shape (F, h, W, C). F is reduced so that chunks stay within
+            @CHUNK_NBYTES, and h < H only if a single frame exceeds @CHUNK_NBYTES
+    """
+    num_frames, height, width, channels = shape
+    row_nbytes = width * channels * itemsize
+    frame_nbytes = height * row_nbytes
+    # keep chunks within @CHUNK_NBYTES, but always hold at least one frame
+    frames_per_chunk = min(frames_per_chunk, num_frames, CHUNK_NBYTES // frame_nbytes)
+    frames_per_chunk = max(1, frames_per_chunk)
+    if frame_nbytes > CHUNK_NBYTES:
+        height = max(1, CHUNK_NBYTES // row_nbytes)
+    return (frames_per_chunk, height, width, channels)
+
+
+def rechunk_dataset(src, dst_grp, name, frames_per_chunk, compression, block_size):
+    """
+    Copies image observation dataset @src into @dst_grp under @name with
+    playback-friendly chunks, @block_size frames at a time.
+    """
+    chunks = get_playback_chunks(src.shape, src.dtype.itemsize, frames_per_chunk)
+    dst = dst_grp.create_dataset(
+        name,
+        shape=src.shape,
+        dtype=src.dtype,
+        chunks=chunks,
+        compression=compression,
+    )
+    for k, v in src.attrs.items():
+        dst.attrs[k] = v
+    for i in range(0, src.shape[0], block_size):
+        dst[i : i + block_size] = src[i : i + block_size]
+
+
+def copy_group(src_grp, dst_grp, frames_per_chunk, compression, block_size):
+    """
+    Recursively copies @src_grp into @dst_grp, rechunking image observations.
+    """
+    for k, v in src_grp.attrs.items():
+        dst_grp.attrs[k] = v
+    for name, item in src_grp.items():
+        if isinstance(item, h5py.Group):
+            copy_group(
+                item,
+                dst_grp.create_group(name),
+                frames_per_chunk=frames_per_chunk,
+                compression=compression,
+                block_size=block_size,
+            )
+        elif is_image_obs(name, item):
+            rechunk_dataset(
+                item,
+                dst_grp,
+                name,
+                frames_per_chunk=frames_per_chunk,
+                compression=compression,
+                block_size=block_size,
+            )
+        else:
+            src_grp.copy(item, dst_grp, name=name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--dataset",
+        type=str,
+        help="path to hdf5 dataset",
+    )
+
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="(optional) path to the rechunked dataset. Defaults to <dataset>_playback.hdf5",
+    )
+
+    parser.add_argument(
+        "--frames_per_chunk",
+        type=int,
+        default=1,
+        help="maximum number of frames per chunk, e.g. the --video_skip used for playback",
+    )
+
+    parser.add_argument(
+        "--compression",
+        type=str,
+        default="lzf",
+        choices=["lzf", "gzip", "none"],
+        help="compression filter for image observations",
+    )
+
+    parser.add_argument(
+        "--block_size",
+        type=int,
+        default=64,
+        help="number of frames copied at once",
+    )
+
+    args = parser.parse_args()
+    if args.output is None:
+        args.output = args.dataset.split(".hdf5")[0] + "_playback.hdf5"
+    assert args.output != args.dataset, "output must differ from the source dataset"
+    compression = None if args.compression == "none" else args.compression
+
+    with h5py.File(args.dataset, "r") as src, h5py.File(args.output, "w") as dst:
+        copy_group(
+            src,
+            dst,
+            frames_per_chunk=args.frames_per_chunk,
+            compression=compression,
+            block_size=args.block_size,
+        )
+
+    print(colored(f"Saved rechunked dataset to {args.output}", "green"))